@@ -1,18 +1,37 @@
+import io
 import os
 import re
-import openpyxl
 import pandas as pd
+import shutil
 import tempfile
-import json
+import multiprocessing
+import threading
+import orjson
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from operator import itemgetter
+from pathlib import Path
 from flask import Flask, request, render_template, send_file, redirect
 from werkzeug.utils import secure_filename
 from openpyxl import Workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import PatternFill
 import time
 
 app = Flask(__name__)  # Initialize a Flask application
 
+# Regex patterns used to extract event details, compiled once for all files
+HTML_EVENT_PATTERN = re.compile(r'<tr><td>(\d+): <font color="#(?:3366FF|606060|009900)">(\d{2}\.\d{2}\.\d{2})\s*(\d{2}:\d{2}:\d{2}):\s*(\S+)\s*(\S+)\s*(\S+)\s*,\s*(\S+)\s*,\s*(\d+)<br>\s*\.+(\S+)')
+SYSLOG_PATTERN = re.compile(r'\**(\w{2,3})\s+(\d{1,2}) (\d{2}:\d{2}:\d{2}\.\d{3}\s*\S*): %(\S+)-(\d)-(\w+): (.+)\s*(?:\s*-Traceback=(.+))?')
+IP_DEVICE_PATTERN = re.compile(r'IP=(\d+\.\d+\.\d+\.\d+)')
+SYSTEM_NAME_PATTERN = re.compile(r'System Name:\s*([^\n\r<]*)')  # Stops at the first HTML tag
+
+ROWS_PER_SHEET = 1048576 - 1  # Excel's row limit per sheet, less the header row
+
+process_pool = None  # Worker processes shared by all requests, created on first use
+process_pool_lock = threading.Lock()  # Stops concurrent requests from each creating a pool
+
 def read_file_with_multiple_encodings(file_path, encodings=['utf-8', 'iso-8859-1', 'windows-1252']):
     """
     Reads a file with multiple encoding options.
@@ -27,154 +46,299 @@ def read_file_with_multiple_encodings(file_path, encodings=['utf-8', 'iso-8859-1
     Raises:
         UnicodeDecodeError: If all encoding attempts fail.
     """
+    data = Path(file_path).read_bytes()  # Read the file from disk only once
     for encoding in encodings:
         try:
-            # Try to open and read the file with the specified encoding
-            with open(file_path, 'r', encoding=encoding) as f:
-                return f.read()  # Return the file content
+            # Try to decode the file content with the specified encoding
+            content = data.decode(encoding)
         except UnicodeDecodeError:
             print(f"Failed to decode with {encoding}, trying next encoding.")  # Print error message for failed encoding
+            continue
+        return content.replace('\r\n', '\n').replace('\r', '\n')  # Translate newlines as text mode reading does
     raise UnicodeDecodeError(f"All tried encodings failed for {file_path}")  # Raise error if all encodings fail
 
-def process_html_files(file_addresses, wb, summary_data):
+def column_widths(df):
     """
-    Processes HTML files and extracts event log data into a worksheet.
+    Computes the column widths needed to fit the content of a DataFrame.
 
     Args:
-        file_addresses (list): List of file paths to process.
-        wb (Workbook): The Excel workbook to add data to.
-        summary_data (list): List to collect summary information about processed files.
+        df (DataFrame): The data that will be written to the worksheet.
+
+    Returns:
+        list: The width of each column, based on its header and its longest value.
+    """
+    widths = []
+    for col_num, header in enumerate(df.columns):
+        column = df.iloc[:, col_num]
+        max_length = column.astype(str).str.len().where(column.notna(), 0).max()  # Longest value in the column, ignoring empty cells
+        widths.append(max(len(str(header)), max_length) + 2)  # Account for the header text as well
+    return widths
+
+def row_column_widths(headers, rows):
     """
-    # Create a new worksheet for the event log data
-    ws_event_log = wb.create_sheet(title="Output_event_log")
+    Computes the column widths needed to fit rows of string values.
 
-    # Add column headers to the worksheet
-    ws_event_log.append(['IP Device', 'System Name', 'Entry ID', 'Date', 'Time', 'Error Type', 'Error Code', 'TaskName', 'Filename', 'Line', 'Parameter'])
+    Args:
+        headers (list): The column headers.
+        rows (list): The rows that will be written below the headers.
 
-    for index, file_address in enumerate(file_addresses, start=1):
-        try:
-            # Get the base name of the file without the extension
-            file_base_name = os.path.splitext(os.path.basename(file_address))[0]
-            # Read the content of the HTML file with appropriate encoding
-            html_content = read_file_with_multiple_encodings(file_address)
-
-            # Extract the IP Device from the HTML content using regex
-            ip_device_match = re.search(r'IP=(\d+\.\d+\.\d+\.\d+)', html_content)
-            ip_device = ip_device_match.group(1) if ip_device_match else "Unknown"  # Default to "Unknown" if not found
-
-            # Extract System Name from the HTML content
-            system_name_match = re.search(r'System Name:\s*([^\n\r]*)', html_content)
-            system_name = system_name_match.group(1).strip().split("<")[0] if system_name_match else "Unknown"  # Default to "Unknown"
-
-            # Define a regex pattern to extract event details from the HTML content
-            pattern1 = re.compile(r'<tr><td>(\d+): <font color="#(?:3366FF|606060|009900)">(\d{2}\.\d{2}\.\d{2})\s*(\d{2}:\d{2}:\d{2}):\s*(\S+)\s*(\S+)\s*(\S+)\s*,\s*(\S+)\s*,\s*(\d+)<br>\s*\.+(\S+)')
-            # Find all matching events in the content
-            events = re.findall(pattern1, html_content)
-
-            if not events:  # If no events were found, skip to the next file
-                print(f"No events found in {file_address}.")
-                continue
+    Returns:
+        list: The width of each column, based on its header and its longest value.
+    """
+    widths = [len(header) + 2 for header in headers]
+    for col_num, values in enumerate(zip(*rows)):
+        widths[col_num] = max(widths[col_num], max(map(len, values)) + 2)  # Longest value in the column
+    return widths
 
-            # Create a DataFrame to store the event data
-            df = pd.DataFrame(events, columns=['Entry ID', 'Date', 'Time', 'Error Type', 'Error Code', 'TaskName', 'Filename', 'Line', 'Parameter'])
-            # Insert extracted IP Device and System Name into the DataFrame
-            df.insert(0, 'System Name', system_name)
-            df.insert(0, 'IP Device', ip_device)
-            df_sorted = df.sort_values(by='Entry ID')  # Sort the DataFrame by Entry ID
-
-            # Append sorted rows to the worksheet
-            for r in dataframe_to_rows(df_sorted, index=False, header=False):
-                ws_event_log.append(r)
-            # Append summary data for the processed file
-            summary_data.append([index, os.path.basename(file_address), ip_device, system_name])
-        except FileNotFoundError:
-            print(f"File not found: {file_address}")  # Print error if the file was not found
-        except Exception as e:
-            print(f"Error processing {file_address}: {e}")  # Print any other errors encountered
-        finally:
-            os.remove(file_address)  # Remove the file after processing
+def save_upload(upload, file_path):
+    """
+    Saves an uploaded file to disk using a 1 MB copy buffer.
 
-    # Set auto filter for the worksheet and adjust column widths
-    ws_event_log.auto_filter.ref = f"A1:{chr(64 + ws_event_log.max_column)}1"
+    Args:
+        upload (FileStorage): The uploaded file.
+        file_path (str): The path to save the file to.
+    """
+    with open(file_path, 'wb') as dst:
+        shutil.copyfileobj(upload.stream, dst, length=1 << 20)
 
-    for col in ws_event_log.columns:
-        max_length = 0  # Initialize maximum length for the column
-        column = col[0].column_letter  # Get the column letter
-        for cell in col:
-            if cell.value and len(str(cell.value)) > max_length:  # Check for the maximum length
-                max_length = len(cell.value)
-        ws_event_log.column_dimensions[column].width = max_length + 2  # Adjust column width
+def remove_file(file_path):
+    """
+    Deletes a file, reporting the failure instead of raising it.
 
-    # Highlight the header row in yellow
-    yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-    for cell in ws_event_log[1]:
-        cell.fill = yellow_fill
+    Args:
+        file_path (str): The path of the file to delete.
+    """
+    try:
+        os.unlink(file_path)
+    except OSError as e:
+        print(f"Failed to remove {file_path}: {e}")  # Print error if the file could not be removed
 
-def process_log_files(file_addresses, wb, summary_data):
+def remove_files(file_paths):
     """
-    Processes log files and extracts system log data into a worksheet.
+    Deletes files in background threads so the request does not wait on the file system.
+
+    Args:
+        file_paths (list): List of file paths to delete.
+    """
+    executor = ThreadPoolExecutor(max_workers=4)
+    executor.map(remove_file, file_paths)
+    executor.shutdown(wait=False)  # Let the deletions finish on their own
+
+def map_files(function, file_paths):
+    """
+    Applies a parsing function to every file, in worker processes when there are several files.
+
+    The pool is shared by all requests and starts its workers with 'spawn', so the
+    threaded server process is never forked. Spawned workers are only started when
+    work is waiting, so a request never starts more workers than it has files.
+
+    If a worker dies, the pool is broken for good: it is dropped so the next request
+    creates a new one, and this batch is parsed in the current process instead.
+
+    Args:
+        function (callable): A module-level function taking a file path.
+        file_paths (list): List of file paths to process.
+
+    Returns:
+        iterable: The results of the function, in the order of file_paths.
+    """
+    global process_pool
+    if len(file_paths) < 2:
+        return map(function, file_paths)  # Not worth handing a single file to another process
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context('spawn'))
+        pool = process_pool
+    # Batch the files only when there are many more of them than workers
+    chunksize = max(1, len(file_paths) // (4 * (os.cpu_count() or 1)))
+    try:
+        return list(pool.map(function, file_paths, chunksize=chunksize))  # Collect here so a broken pool is caught below
+    except BrokenProcessPool as e:
+        print(f"Process pool broken, parsing in this process instead: {e}")
+        with process_pool_lock:
+            if process_pool is pool:  # Another request may already have replaced it
+                process_pool = None
+        pool.shutdown(wait=False)
+        return list(map(function, file_paths))
+
+def set_column_widths(ws, widths):
+    """
+    Sets the column widths of a write-only worksheet.
+
+    Write-only worksheets cannot be re-read once rows are appended, so this must be
+    called before the first row is written.
+
+    Args:
+        ws (WriteOnlyWorksheet): The worksheet to adjust.
+        widths (list): The width of each column, as returned by column_widths.
+    """
+    for col_num, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(col_num)].width = width
+
+def styled_cells(ws, values, fill):
+    """
+    Wraps values in write-only cells with the given fill.
+
+    Args:
+        ws (WriteOnlyWorksheet): The worksheet the cells belong to.
+        values (list): The values of the cells.
+        fill (PatternFill): The fill to apply to every cell.
+
+    Returns:
+        list: A list of styled WriteOnlyCell objects ready to be appended.
+    """
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = fill
+        cells.append(cell)
+    return cells
+
+def parse_html_file(file_address):
+    """
+    Extracts the event log data of a single HTML file.
+
+    Runs in a worker process, so it only reads the file and never touches the workbook.
+
+    Args:
+        file_address (str): The path to the HTML file.
+
+    Returns:
+        tuple: The IP Device, the System Name and the sorted event rows of the file,
+        or None if the file could not be processed or contains no events.
+    """
+    try:
+        # Read the content of the HTML file with appropriate encoding
+        html_content = read_file_with_multiple_encodings(file_address)
+
+        # Extract the IP Device from the HTML content using regex
+        ip_device_match = IP_DEVICE_PATTERN.search(html_content)
+        ip_device = ip_device_match.group(1) if ip_device_match else "Unknown"  # Default to "Unknown" if not found
+
+        # Extract System Name from the HTML content
+        system_name_match = SYSTEM_NAME_PATTERN.search(html_content)
+        system_name = system_name_match.group(1).strip() if system_name_match else "Unknown"  # Default to "Unknown"
+
+        # Find all matching events in the content
+        events = HTML_EVENT_PATTERN.findall(html_content)
+
+        if not events:  # If no events were found, skip the file
+            print(f"No events found in {file_address}.")
+            return None
+
+        events.sort(key=itemgetter(0))  # Sort the events by Entry ID
+        # Prefix each event with the extracted IP Device and System Name
+        rows = [(ip_device, system_name, *event) for event in events]
+        return ip_device, system_name, rows
+    except FileNotFoundError:
+        print(f"File not found: {file_address}")  # Print error if the file was not found
+    except Exception as e:
+        print(f"Error processing {file_address}: {e}")  # Print any other errors encountered
+    return None
+
+def process_html_files(file_addresses, ws_event_log, summary_data):
+    """
+    Processes HTML files and extracts event log data into a worksheet.
 
     Args:
         file_addresses (list): List of file paths to process.
-        wb (Workbook): The Excel workbook to add data to.
+        ws_event_log (WriteOnlyWorksheet): The empty worksheet to add the event log data to.
         summary_data (list): List to collect summary information about processed files.
     """
-    # Create a new worksheet for system log data
-    ws_syslog = wb.create_sheet(title="Syslog")
-
-    # Add column headers to the worksheet
-    ws_syslog.append(['System Name', 'Month', 'Date', 'Timestamp', 'Facility', 'Severity Level', 'Mnemonic', 'Message Text', 'Traceback'])
+    # Column headers of the worksheet
+    headers = ['IP Device', 'System Name', 'Entry ID', 'Date', 'Time', 'Error Type', 'Error Code', 'TaskName', 'Filename', 'Line', 'Parameter']
+    rows = []  # Sorted event rows of each file, written once all files are parsed
+
+    # Parse the files in parallel; results come back in the order of file_addresses
+    results = map_files(parse_html_file, file_addresses)
+    for index, (file_address, result) in enumerate(zip(file_addresses, results), start=1):
+        if result is None:
+            continue
+        ip_device, system_name, file_rows = result
+        rows.extend(file_rows)
+
+        # Append summary data for the processed file
+        summary_data.append([index, os.path.basename(file_address), ip_device, system_name])
+
+    # Set auto filter for the worksheet and adjust column widths before writing any row
+    ws_event_log.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(rows) + 1}"
+    set_column_widths(ws_event_log, row_column_widths(headers, rows))
+
+    # Write the header row highlighted in yellow, followed by the event rows
+    yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+    ws_event_log.append(styled_cells(ws_event_log, headers, yellow_fill))
+    for r in rows:
+        ws_event_log.append(r)
 
-    for index, file_address in enumerate(file_addresses, start=1):
-        try:
-            # Extract the system name from the file name
-            system_name = os.path.basename(file_address).split('.')[0].split('_')[-1]
-            # Read the content of the log file with appropriate encoding
-            txt_content = read_file_with_multiple_encodings(file_address)
-
-            # Define a regex pattern to extract log events
-            pattern1 = re.compile(r'\**(\w{2,3})\s+(\d{1,2}) (\d{2}:\d{2}:\d{2}\.\d{3}\s*\S*): %(\S+)-(\d)-(\w+): (.+)\s*(?:\s*-Traceback=(.+))?')
-            # Find all matching events in the content
-            events = re.findall(pattern1, txt_content)
-
-            if not events:  # If no events were found, skip to the next file
-                print(f"No events found in {file_address}.")
-                continue
+def parse_log_file(file_address):
+    """
+    Extracts the system log data of a single log file.
 
-            # Create a DataFrame to store the log data
-            df = pd.DataFrame(events, columns=['Month', 'Date', 'Timestamp', 'Facility', 'Severity Level', 'Mnemonic', 'Message Text', 'Traceback'])
-            # Insert extracted System Name into the DataFrame
-            df.insert(0, 'System Name', system_name)
-            df_sorted = df.sort_values(by='Timestamp')  # Sort the DataFrame by Timestamp
-
-            # Append sorted rows to the worksheet
-            for r in dataframe_to_rows(df_sorted, index=False, header=False):
-                ws_syslog.append(r)
-
-            # Append summary data for the processed file
-            summary_data.append([index, os.path.basename(file_address), system_name])
-        except FileNotFoundError:
-            print(f"File not found: {file_address}")  # Print error if the file was not found
-        except Exception as e:
-            print(f"Error processing {file_address}: {e}")  # Print any other errors encountered
-        finally:
-            os.remove(file_address)  # Remove the file after processing
+    Runs in a worker process, so it only reads the file and never touches the workbook.
 
-    # Set auto filter for the worksheet and adjust column widths
-    ws_syslog.auto_filter.ref = f"A1:{chr(64 + ws_syslog.max_column)}1"
+    Args:
+        file_address (str): The path to the log file.
 
-    for col in ws_syslog.columns:
-        max_length = 0  # Initialize maximum length for the column
-        column = col[0].column_letter  # Get the column letter
-        for cell in col:
-            if cell.value and len(str(cell.value)) > max_length:  # Check for the maximum length
-                max_length = len(cell.value)
-        ws_syslog.column_dimensions[column].width = max_length + 2  # Adjust column width
+    Returns:
+        tuple: The System Name and the sorted log rows of the file, or None if the
+        file could not be processed or contains no events.
+    """
+    try:
+        # Extract the system name from the file name
+        system_name = os.path.basename(file_address).split('.')[0].split('_')[-1]
+        # Read the content of the log file with appropriate encoding
+        txt_content = read_file_with_multiple_encodings(file_address)
+
+        # Find all matching events in the content
+        events = SYSLOG_PATTERN.findall(txt_content)
+
+        if not events:  # If no events were found, skip the file
+            print(f"No events found in {file_address}.")
+            return None
+
+        events.sort(key=itemgetter(2))  # Sort the events by Timestamp
+        # Prefix each event with the extracted System Name
+        rows = [(system_name, *event) for event in events]
+        return system_name, rows
+    except FileNotFoundError:
+        print(f"File not found: {file_address}")  # Print error if the file was not found
+    except Exception as e:
+        print(f"Error processing {file_address}: {e}")  # Print any other errors encountered
+    return None
+
+def process_log_files(file_addresses, ws_syslog, summary_data):
+    """
+    Processes log files and extracts system log data into a worksheet.
 
-    # Highlight the header row in yellow
+    Args:
+        file_addresses (list): List of file paths to process.
+        ws_syslog (WriteOnlyWorksheet): The empty worksheet to add the system log data to.
+        summary_data (list): List to collect summary information about processed files.
+    """
+    # Column headers of the worksheet
+    headers = ['System Name', 'Month', 'Date', 'Timestamp', 'Facility', 'Severity Level', 'Mnemonic', 'Message Text', 'Traceback']
+    rows = []  # Sorted log rows of each file, written once all files are parsed
+
+    # Parse the files in parallel; results come back in the order of file_addresses
+    results = map_files(parse_log_file, file_addresses)
+    for index, (file_address, result) in enumerate(zip(file_addresses, results), start=1):
+        if result is None:
+            continue
+        system_name, file_rows = result
+        rows.extend(file_rows)
+
+        # Append summary data for the processed file
+        summary_data.append([index, os.path.basename(file_address), system_name])
+
+    # Set auto filter for the worksheet and adjust column widths before writing any row
+    ws_syslog.auto_filter.ref = f"A1:{get_column_letter(len(headers))}{len(rows) + 1}"
+    set_column_widths(ws_syslog, row_column_widths(headers, rows))
+
+    # Write the header row highlighted in yellow, followed by the log rows
     yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-    for cell in ws_syslog[1]:
-        cell.fill = yellow_fill
+    ws_syslog.append(styled_cells(ws_syslog, headers, yellow_fill))
+    for r in rows:
+        ws_syslog.append(r)
 
 def extract_link_data(file_path):
     """
@@ -189,77 +353,75 @@ def extract_link_data(file_path):
     json_list = []
     with open(file_path, 'r') as file:
         for line in file:
-            # Check if the line contains JSON data
-            if re.search(r'\{.*\}', line):
-                # Extract the date and time from the log line
-                date_time_match = re.match(r'INFO - (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', line)
-                if date_time_match:
-                    date_time = date_time_match.group(1)
-                    date, time = date_time.split(' ')
-                    json_str = line[line.find('{'):]
-                    try:
-                        # Load the JSON data and add Date and Time
-                        data = json.loads(json_str)
-                        data['Date'] = date
-                        data['Time'] = time
-                        json_list.append(data)
-                    except json.JSONDecodeError:
-                        print(f"Invalid JSON: {json_str}")
+            # Check if the line contains JSON data: a '{' followed later by a '}'
+            json_start = line.find('{')
+            if json_start < 0 or line.rfind('}') < json_start:
+                continue
+            # Extract the date and time from the fixed-width 'INFO - YYYY-MM-DD HH:MM:SS' prefix
+            if line.startswith('INFO - '):
+                date, _, time = line[7:26].partition(' ')
+                json_str = line[json_start:]
+                try:
+                    # Load the JSON data and add Date and Time
+                    data = orjson.loads(json_str)
+                    data['Date'] = date
+                    data['Time'] = time
+                    json_list.append(data)
+                except orjson.JSONDecodeError:
+                    print(f"Invalid JSON: {json_str}")
     return json_list
 
-def process_link_files(file_paths, wb, summary_data):
+def normalize_items(json_data):
+    """
+    Flattens the items of JSON records into a DataFrame with one row per item.
+
+    Args:
+        json_data (list): List of JSON records, each holding an 'items' list.
+
+    Returns:
+        DataFrame: The items, with the other fields of their record repeated on each row.
+    """
+    records = [data for data in json_data if data.get('items')]  # Records without items add no rows
+    if not records:
+        return pd.DataFrame()
+    items_df = pd.json_normalize(records, record_path='items', max_level=0)  # Keep nested values in a single column
+
+    # Every top-level field except 'items' is copied onto the rows of its items
+    meta_df = pd.DataFrame([{key: value for key, value in data.items() if key != 'items'} for data in records])
+    meta_df = meta_df.loc[meta_df.index.repeat([len(data['items']) for data in records])].reset_index(drop=True)
+
+    # Top-level fields take precedence over item fields of the same name
+    items_df = items_df.drop(columns=items_df.columns.intersection(meta_df.columns))
+    return items_df.join(meta_df)
+
+def process_link_files(file_paths, ws, summary_data):
     """
     Processes multiple link files and appends the extracted data to a worksheet.
 
     Args:
         file_paths (list): List of file paths to process.
-        wb (Workbook): The Excel workbook to add data to.
+        ws (WriteOnlyWorksheet): The empty worksheet to add the link status data to.
         summary_data (list): List to collect summary information about processed files.
     """
-    # Create a new worksheet for link status data
-    ws = wb.create_sheet(title="link_status_jms")
-
-    all_items = []
-    for file_path in file_paths:
-        # Extract JSON data from each file
-        json_data = extract_link_data(file_path)
-        for data in json_data:
-            # Pop 'items' from data if it exists
-            items = data.pop('items', [])
-            for item in items:
-                # Update item with data fields
-                item.update(data)
-                all_items.append(item)
+    all_data = []
+    # Extract JSON data from each file in parallel
+    for json_data in map_files(extract_link_data, file_paths):
+        all_data.extend(json_data)
+
+    # Create a DataFrame from the items of all JSON data
+    items_df = normalize_items(all_data)
 
     # Check if any items were collected
-    if not all_items:
+    if items_df.empty:
         print("No JSON data found in files.")
         return
     
-    # Create a DataFrame from the collected items
-    items_df = pd.DataFrame(all_items)
-    
     # Reorder columns to have Date and Time first
     columns_order = ['Date', 'Time'] + [col for col in items_df.columns if col not in ['Date', 'Time']]
     items_df = items_df[columns_order]
 
-    # Write DataFrame headers to the worksheet
-    headers = list(items_df.columns)
-    ws.append(headers)
-
-    # Write DataFrame rows to the worksheet
-    for row in dataframe_to_rows(items_df, index=False, header=False):
-        ws.append(row)
-
     # Adjust column widths based on the longest item in each column
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        adjusted_width = max_length + 2
-        ws.column_dimensions[column].width = adjusted_width
+    set_column_widths(ws, column_widths(items_df))
 
     # Define fill styles for headers
     header_fill_green = PatternFill(start_color='8ED973', end_color='8ED973', fill_type='solid')
@@ -268,17 +430,22 @@ def process_link_files(file_paths, wb, summary_data):
     # Set header colors based on their names
     green_headers = {'Date', 'Time', 'node', 'apiVersion', 'messageSendTime', 'messageId', 'sequenceNumber', 'itemCount'}
 
-    for col_num, cell in enumerate(ws[1], 1):
-        if cell.value in green_headers:
-            cell.fill = header_fill_green
-        else:
-            cell.fill = header_fill_yellow
+    # Write DataFrame headers to the worksheet
+    headers = []
+    for header in items_df.columns:
+        fill = header_fill_green if header in green_headers else header_fill_yellow
+        headers.extend(styled_cells(ws, [header], fill))
+    ws.append(headers)
+
+    # Write DataFrame rows to the worksheet
+    for row in items_df.itertuples(index=False, name=None):
+        ws.append(row)
 
     # Enable auto filter for the worksheet
-    ws.auto_filter.ref = ws.dimensions
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(items_df.columns))}{len(items_df) + 1}"
 
     # Add to summary_data (to keep track of processed files)
-    summary_data.append([len(file_paths), os.path.basename(file_path)])
+    summary_data.append([len(file_paths), os.path.basename(file_paths[-1])])
 
 def extract_equipment_data(file_path):
     """
@@ -288,146 +455,109 @@ def extract_equipment_data(file_path):
         file_path (str): The path to the log file.
 
     Returns:
-        list: A list of extracted JSON data with added Date and Time fields.
+        list: A list of extracted JSON data that have a messageSendTime field.
     """
     json_list = []
     with open(file_path, 'r') as file:
         for line in file:
-            # Check if the line contains JSON data
-            if re.search(r'\{.*\}', line):
-                try:
-                    # Extract JSON string from the line
-                    json_str = line[line.find('{'):]
-                    data = json.loads(json_str)
-
-                    # Check if 'messageSendTime' is in the data
-                    if 'messageSendTime' in data:
-                        datetime_str = data['messageSendTime']
-                        date, time = datetime_str.split('T')  # Split date and time
-                        time = time.split('+')[0]  # Remove timezone
-                        data['Date'] = date  # Add Date field
-                        data['Time'] = time.split('.')[0]  # Add Time field without milliseconds
-                        json_list.append(data)
-                except json.JSONDecodeError as e:
-                    print(f"Invalid JSON: {line.strip()}")  # Print invalid JSON lines
+            # Check if the line contains JSON data: a '{' followed later by a '}'
+            json_start = line.find('{')
+            if json_start < 0 or line.rfind('}') < json_start:
+                continue
+            try:
+                # Extract JSON string from the line
+                data = orjson.loads(line[json_start:])
+
+                # Keep the data only if 'messageSendTime' is in it
+                if 'messageSendTime' in data:
+                    json_list.append(data)
+            except orjson.JSONDecodeError:
+                print(f"Invalid JSON: {line.strip()}")  # Print invalid JSON lines
     return json_list
 
-# Flatten nested items to a single dictionary
-def flatten_items(items):
-    """
-    Flattens nested items into a single dictionary.
-
-    Args:
-        items (list): List of items to flatten.
-
-    Returns:
-        list: A list of flattened items.
-    """
-    flat_items = []
-    for item in items:
-        flat_item = item.copy()  # Create a copy to avoid modifying the original
-        if 'equipmentItems' in item:
-            flat_item['equipmentItems'] = str(item['equipmentItems'])  # Convert nested items to string
-        flat_items.append(flat_item)
-    return flat_items
-
-def process_equipment_files(file_paths, wb, summary_data):
+def process_equipment_files(file_paths, ws, summary_data):
     """
     Processes multiple equipment files and appends the extracted data to a worksheet.
 
+    Rows that do not fit in the worksheet go to new sheets of the same workbook.
+
     Args:
         file_paths (list): List of file paths to process.
-        wb (Workbook): The Excel workbook to add data to.
+        ws (WriteOnlyWorksheet): The empty worksheet to add the equipment status data to.
         summary_data (list): List to collect summary information about processed files.
     """
-    # Create a new worksheet for equipment status data
-    ws = wb.create_sheet(title="equipment_status")
-
-    columns_per_sheet = 1000000  # Change the maximum rows per sheet
-    row_count = 0
-
-    def add_data_to_sheet(df):
+    def add_data_to_sheet(ws, df):
         """
-        Adds DataFrame data to the worksheet.
+        Adds DataFrame data to a new worksheet, below a header row.
 
         Args:
+            ws (WriteOnlyWorksheet): The empty worksheet to write to.
             df (DataFrame): DataFrame containing data to add to the worksheet.
         """
-        nonlocal row_count
-        if row_count == 0:  # Add headers only for the first sheet
-            ws.append(list(df.columns))
-        for row in dataframe_to_rows(df, index=False, header=False):
-            if row_count >= columns_per_sheet:
-                break  # Stop adding if row limit is reached
+        # Column widths must be set before the first row of a write-only sheet
+        set_column_widths(ws, widths)
+
+        headers = []
+        for header, fill in zip(df.columns, header_fills):
+            headers.extend(styled_cells(ws, [header], fill))
+        ws.append(headers)
+        for row in df.itertuples(index=False, name=None):
             ws.append(row)
-            row_count += 1
-        
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = max_length + 2
-            ws.column_dimensions[column].width = adjusted_width
-
-        header_fill_green = PatternFill(start_color='8ED973', end_color='8ED973', fill_type='solid')
-        header_fill_yellow = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-        
-        green_headers = {'Date', 'Time', 'node', 'apiVersion', 'messageSendTime', 'messageId', 'sequenceNumber', 'itemCount'}
-        
-        for col_num, cell in enumerate(ws[1], 1):
-            if cell.value in green_headers:
-                cell.fill = header_fill_green
-            else:
-                cell.fill = header_fill_yellow
-        
-        ws.auto_filter.ref = ws.dimensions
 
-    all_items = []        
+        ws.auto_filter.ref = f"A1:{get_column_letter(len(df.columns))}{len(df) + 1}"
+
+    all_data = []
     
     total_files_processed = 0
-    total_items_processed = 0
 
-    for file_path in file_paths:
-        json_data = extract_equipment_data(file_path)
+    # Extract JSON data from each file in parallel
+    results = map_files(extract_equipment_data, file_paths)
+    for file_path, json_data in zip(file_paths, results):
         if not json_data:
             print(f"No JSON data found in file: {file_path}")
         total_files_processed += 1
-        for data in json_data:
-            items = data.pop('items', [])
-            if items:  # Check if items exist
-                flat_items = flatten_items(items)  # Flatten nested items
-                for item in flat_items:
-                    item.update(data)
-                    all_items.append(item)
-                    total_items_processed += 1
-
-    if not all_items:
+        all_data.extend(json_data)
+
+    # Convert nested equipment items to strings before normalizing, so a JSON null
+    # becomes 'None' while an item without the key stays empty
+    for data in all_data:
+        for item in data.get('items') or []:
+            if 'equipmentItems' in item:
+                item['equipmentItems'] = str(item['equipmentItems'])
+
+    items_df = normalize_items(all_data)
+
+    if items_df.empty:
         print("No JSON data found in files.")
         return
 
-    items_df = pd.DataFrame(all_items)
+    # Split messageSendTime (e.g. 2024-01-01T10:11:12.123+07:00) into Date and Time for all rows at once
+    send_time = items_df['messageSendTime'].str.partition('T')
+    items_df['Date'] = send_time[0]  # Add Date column
+    items_df['Time'] = send_time[2].str.partition('+')[0].str.partition('.')[0]  # Add Time column without timezone and milliseconds
     
     # Reorder columns
     columns_order = ['Date', 'Time'] + [col for col in items_df.columns if col not in ['Date', 'Time']]
     items_df = items_df[columns_order]
 
-    # Process data and stop if exceeds max rows
-    while not items_df.empty:
-        if row_count >= columns_per_sheet:
-            # Create a new sheet and reset row_count
-            ws = wb.create_sheet(title=f"Sheet{len(wb.worksheets) + 1}")
-            row_count = 0
+    # Compute column widths once for all sheets
+    widths = column_widths(items_df)
 
-        split_index = min(columns_per_sheet - row_count, len(items_df))
-        part_df = items_df.iloc[:split_index]
-        items_df = items_df.iloc[split_index:]
-        
-        add_data_to_sheet(part_df)
+    # Choose the fill of each header once for all sheets
+    header_fill_green = PatternFill(start_color='8ED973', end_color='8ED973', fill_type='solid')
+    header_fill_yellow = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
+
+    green_headers = {'Date', 'Time', 'node', 'apiVersion', 'messageSendTime', 'messageId', 'sequenceNumber', 'itemCount'}
+
+    header_fills = [header_fill_green if header in green_headers else header_fill_yellow for header in items_df.columns]
+
+    # Write the data in slices that fit in a sheet, taken once from the full DataFrame
+    for start in range(0, len(items_df), ROWS_PER_SHEET):
+        if start:
+            # Create a new sheet for the rows past the limit
+            wb = ws.parent
+            ws = wb.create_sheet(title=f"Sheet{len(wb.worksheets) + 1}")
+        add_data_to_sheet(ws, items_df.iloc[start:start + ROWS_PER_SHEET])
 
     # Add summary data to summary_data list
     summary_data.append([total_files_processed, os.path.basename(file_path)])
@@ -441,106 +571,120 @@ def index():
         if not input_files:  # Check if no files were uploaded
             return "No files uploaded"  # Return an error message
 
-        # Filter uploaded files based on their extensions
-        html_files = [file for file in input_files if file.filename.endswith('.html')]
-        log_files = [file for file in input_files if file.filename.endswith('.log') and not file.filename.split('/')[1].startswith('link') and not file.filename.split('/')[1].startswith('equipment')]
-        text_files = [file for file in input_files if file.filename.endswith('.txt') and not file.filename.split('/')[1].startswith('link') and not file.filename.split('/')[1].startswith('equipment')]
-        link_files = [file for file in input_files if file.filename.split('/')[1].startswith('link') and not file.filename.split('/')[1].startswith('equipment')]
-        equipment_files = [file for file in input_files if file.filename.split('/')[1].startswith('equipment')]
+        # Sort uploaded files by their extensions and the name below the uploaded folder, in a single pass
+        html_files, log_files, text_files, link_files, equipment_files = [], [], [], [], []
+        secure_names = {}  # Secure file name of each upload, computed once per name
+        for file in input_files:
+            name = file.filename
+            if name not in secure_names:
+                secure_names[name] = secure_filename(name)
+            parts = name.split('/', 2)
+            sub_name = parts[1] if len(parts) > 1 else ''  # Files outside a folder have no sub name
+            if name.endswith('.html'):
+                html_files.append(file)
+            elif sub_name.startswith('equipment'):
+                equipment_files.append(file)
+            elif sub_name.startswith('link'):
+                link_files.append(file)
+            elif name.endswith('.log'):
+                log_files.append(file)
+            elif name.endswith('.txt'):
+                text_files.append(file)
 	
         temp_dir = tempfile.gettempdir()  # Get the temporary directory for saving uploaded files
-        wb = openpyxl.Workbook()  # Create a new Excel workbook
-        ws_summary = wb.active  # Get the active worksheet
-        ws_summary.title = "Number of files"  # Set the title of the worksheet
-        ws_summary.append(['Total Number of Files'])  # Add header for total number of files
+        wb = Workbook(write_only=True)  # Create a new streaming Excel workbook
+        ws_summary = wb.create_sheet(title="Number of files")  # Create the summary worksheet first so it stays first
+        summary_headers = []  # Headers of the summary sheet, written once all files are processed
         
         summary_data = []  # Initialize a list to hold summary data
+        saved_files = []  # Paths of all saved uploads, deleted once they are processed
 
-        # Process HTML files if any are uploaded
-        if html_files:
-            ws_summary.append(['No.', 'Filename', 'IP Devices', 'System Names'])  # Add headers for HTML files
-            html_file_addresses = []  # List to hold paths of saved HTML files
-            for html_file in html_files:
-                file_path = os.path.join(temp_dir, secure_filename(html_file.filename))  # Create secure file path
-                html_file.save(file_path)  # Save the HTML file
-                html_file_addresses.append(file_path)  # Add file path to the list
-            process_html_files(html_file_addresses, wb, summary_data)  # Process HTML files
-
-        # Process LOG files if any are uploaded
-        if log_files:
-            ws_summary.append(['No.', 'Filename', 'System Names'])  # Add headers for LOG files
-            log_file_addresses = []  # List to hold paths of saved LOG files
-            for log_file in log_files:
-                file_path = os.path.join(temp_dir, secure_filename(log_file.filename))  # Create secure file path
-                log_file.save(file_path)  # Save the LOG file
-                log_file_addresses.append(file_path)  # Add file path to the list
-            process_log_files(log_file_addresses, wb, summary_data)  # Process LOG files
-
-        # Process TXT files if any are uploaded
-        if text_files:
-            ws_summary.append(['No.', 'Filename', 'System Names'])  # Add headers for TXT files
-            text_file_addresses = []  # List to hold paths of saved TXT files
-            for text_file in text_files:
-                file_path = os.path.join(temp_dir, secure_filename(text_file.filename))  # Create secure file path
-                text_file.save(file_path)  # Save the TXT file
-                text_file_addresses.append(file_path)  # Add file path to the list
-            process_log_files(text_file_addresses, wb, summary_data)  # Process TXT files (same as log files)
-
-        # Process LINK files if any are uploaded
-        if link_files:
-            ws_summary.append(['No.', 'Filename'])  # Add headers for LINK files
-            link_file_addresses = []  # List to hold paths of saved LINK files
-            for link_file in link_files:
-                file_path = os.path.join(temp_dir, secure_filename(link_file.filename))  # Create secure file path
-                link_file.save(file_path)  # Save the LINK file
-                link_file_addresses.append(file_path)  # Add file path to the list
-            process_link_files(link_file_addresses, wb, summary_data)  # Process LINK files
+        try:
+            # Process HTML files if any are uploaded
+            if html_files:
+                summary_headers.append(['No.', 'Filename', 'IP Devices', 'System Names'])  # Add headers for HTML files
+                html_file_addresses = []  # List to hold paths of saved HTML files
+                for html_file in html_files:
+                    file_path = os.path.join(temp_dir, secure_names[html_file.filename])  # Create secure file path
+                    save_upload(html_file, file_path)  # Save the HTML file
+                    saved_files.append(file_path)  # Remember the file so it is removed whatever happens
+                    html_file_addresses.append(file_path)  # Add file path to the list
+                ws = wb.create_sheet(title="Output_event_log")  # Create a new worksheet for event log data
+                process_html_files(html_file_addresses, ws, summary_data)  # Process HTML files
+
+            # Process LOG files if any are uploaded
+            if log_files:
+                summary_headers.append(['No.', 'Filename', 'System Names'])  # Add headers for LOG files
+                log_file_addresses = []  # List to hold paths of saved LOG files
+                for log_file in log_files:
+                    file_path = os.path.join(temp_dir, secure_names[log_file.filename])  # Create secure file path
+                    save_upload(log_file, file_path)  # Save the LOG file
+                    saved_files.append(file_path)  # Remember the file so it is removed whatever happens
+                    log_file_addresses.append(file_path)  # Add file path to the list
+                ws = wb.create_sheet(title="Syslog")  # Create a new worksheet for system log data
+                process_log_files(log_file_addresses, ws, summary_data)  # Process LOG files
+
+            # Process TXT files if any are uploaded
+            if text_files:
+                summary_headers.append(['No.', 'Filename', 'System Names'])  # Add headers for TXT files
+                text_file_addresses = []  # List to hold paths of saved TXT files
+                for text_file in text_files:
+                    file_path = os.path.join(temp_dir, secure_names[text_file.filename])  # Create secure file path
+                    save_upload(text_file, file_path)  # Save the TXT file
+                    saved_files.append(file_path)  # Remember the file so it is removed whatever happens
+                    text_file_addresses.append(file_path)  # Add file path to the list
+                ws = wb.create_sheet(title="Syslog")  # Create a new worksheet for system log data
+                process_log_files(text_file_addresses, ws, summary_data)  # Process TXT files (same as log files)
+
+            # Process LINK files if any are uploaded
+            if link_files:
+                summary_headers.append(['No.', 'Filename'])  # Add headers for LINK files
+                link_file_addresses = []  # List to hold paths of saved LINK files
+                for link_file in link_files:
+                    file_path = os.path.join(temp_dir, secure_names[link_file.filename])  # Create secure file path
+                    save_upload(link_file, file_path)  # Save the LINK file
+                    saved_files.append(file_path)  # Remember the file so it is removed whatever happens
+                    link_file_addresses.append(file_path)  # Add file path to the list
+                ws = wb.create_sheet(title="link_status_jms")  # Create a new worksheet for link status data
+                process_link_files(link_file_addresses, ws, summary_data)  # Process LINK files
         
-        # Process Equipment files if any are uploaded
-        if equipment_files:
-            ws_summary.append(['No.', 'Filename'])  # Add headers for Equipment files
-            equipment_file_addresses = []  # List to hold paths of saved Equipment files
-            for equipment_file in equipment_files:
-                file_path = os.path.join(temp_dir, secure_filename(equipment_file.filename))  # Create secure file path
-                equipment_file.save(file_path)  # Save the Equipment file
-                equipment_file_addresses.append(file_path)  # Add file path to the list
-            process_equipment_files(equipment_file_addresses, wb, summary_data)  # Process Equipment files
-
-        # Update summary sheet with total number of files processed
+            # Process Equipment files if any are uploaded
+            if equipment_files:
+                summary_headers.append(['No.', 'Filename'])  # Add headers for Equipment files
+                equipment_file_addresses = []  # List to hold paths of saved Equipment files
+                for equipment_file in equipment_files:
+                    file_path = os.path.join(temp_dir, secure_names[equipment_file.filename])  # Create secure file path
+                    save_upload(equipment_file, file_path)  # Save the Equipment file
+                    saved_files.append(file_path)  # Remember the file so it is removed whatever happens
+                    equipment_file_addresses.append(file_path)  # Add file path to the list
+                ws = wb.create_sheet(title="equipment_status")  # Create a new worksheet for equipment status data
+                process_equipment_files(equipment_file_addresses, ws, summary_data)  # Process Equipment files
+        finally:
+            remove_files(saved_files)  # Remove the files after processing, even if it failed
+
+        # Build the summary sheet with the total number of files processed
         total_files = len(summary_data)  # Count total files
-        ws_summary.cell(row=1, column=2, value=total_files)  # Update the count in the summary sheet
-        for row in summary_data:  # Append each summary row
-            ws_summary.append(row)
+        summary_rows = [['Total Number of Files', total_files]] + summary_headers + summary_data
 
         # Adjust column widths based on content
-        for col in ws_summary.columns:
-            max_length = 0  # Initialize max length variable
-            column = col[0].column_letter  # Get the letter of the current column
-            for cell in col:  # Iterate through each cell
-                if cell.value and len(str(cell.value)) > max_length:  # Check for non-empty cells
-                    max_length = len(str(cell.value))  # Update max length
-            ws_summary.column_dimensions[column].width = max_length + 2  # Set column width
+        set_column_widths(ws_summary, column_widths(pd.DataFrame(summary_rows)))
 
         # Create fill styles for header cells
         yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')  # Yellow fill for headers
         light_yellow_fill = PatternFill(start_color='FFFFCC', end_color='FFFFCC', fill_type='solid')  # Light yellow fill
 
-        ws_summary['A1'].fill = yellow_fill  # Apply fill to the first header cell
-        ws_summary['B1'].fill = light_yellow_fill  # Apply fill to the second header cell
-        for cell in ws_summary[2]:  # Apply fill to the second row
-            cell.fill = yellow_fill
-
-        output_file_path = os.path.join(temp_dir, f'{secure_filename(file_name)}.xlsx')  # Define output file path
+        # Apply yellow to the total label and light yellow to the count
+        ws_summary.append(styled_cells(ws_summary, summary_rows[0][:1], yellow_fill) + styled_cells(ws_summary, summary_rows[0][1:], light_yellow_fill))
+        for row_num, row in enumerate(summary_rows[1:], start=2):  # Append each summary row
+            ws_summary.append(styled_cells(ws_summary, row, yellow_fill) if row_num == 2 else row)  # Apply fill to the second row
 
-        # Remove the default 'Sheet' if it exists
-        if 'Sheet' in wb.sheetnames:
-            ws = wb['Sheet']  # Get default sheet
-            wb.remove(ws)  # Remove default sheet
-            
-        wb.save(output_file_path)  # Save the workbook to the output path
+        output_file = io.BytesIO()  # Keep the workbook in memory instead of a temporary file
+        wb.save(output_file)  # Save the workbook to the in-memory file
+        output_file.seek(0)  # Rewind so the response is sent from the start
 
         # Send the saved file as a response for download
-        response = send_file(output_file_path, as_attachment=True, download_name=f'{secure_filename(file_name)}.xlsx')  # Create response
+        response = send_file(output_file, as_attachment=True, download_name=f'{secure_filename(file_name)}.xlsx',
+                             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')  # Create response
 
         return response  # Return the response to initiate download
 